@@ -1,62 +1,178 @@
+import atexit
 from datetime import datetime, timezone
+from hashlib import blake2b
+import itertools
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import mimetypes
+import os
+import queue
+import threading
 import time
-import uuid
-from flask import Flask, request, jsonify, send_from_directory
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from flask import Flask, Response, abort, request
 from flask_cors import CORS
+import orjson
 from pydantic import ValidationError
-from models import SurveySubmission
-from storage import append_json_line, iter_json_lines, RESULTS_PATH
+from models import SURVEY_VALIDATOR
+from storage import (
+    append_json_line,
+    RESULTS_PATH,
+    SubmissionIndex,
+)
 
 app = Flask(__name__)
 # Allow cross-origin requests so the static HTML can POST from localhost or file://
 CORS(app, resources={r"/v1/*": {"origins": "*"}})
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 logger = logging.getLogger("survey_api")
+# Request logs are handed to a background listener so the stream write
+# happens off the request thread.
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(message)s"))
+_queue_handler = QueueHandler(queue.SimpleQueue())
+logger.addHandler(_queue_handler)
+logger.propagate = False
+_log_listener: Optional[QueueListener] = None
+
+
+def _start_log_listener() -> None:
+    """(Re)start the log thread on a fresh queue; each forked worker needs one."""
+    global _log_listener
+    _queue_handler.queue = queue.SimpleQueue()
+    _log_listener = QueueListener(_queue_handler.queue, _log_handler)
+    _log_listener.start()
+
+
+def _stop_log_listener() -> None:
+    if _log_listener is not None:
+        _log_listener.stop()
+
+
+_start_log_listener()
+atexit.register(_stop_log_listener)
+# Request ids are "<pid>-<boot>-<n>": unique per process without urandom
+_REQ_COUNTER = itertools.count()
+_PID = os.getpid()
+_BOOT = int(time.time())
+# Guards the dedupe index so check-then-append is atomic across threads
+_index_lock = threading.Lock()
+
+
+def _after_fork_in_child() -> None:
+    # gunicorn --preload imports this module once, then forks the workers;
+    # threads and locks from the parent do not carry over.
+    global _PID, _index_lock
+    _PID = os.getpid()
+    _index_lock = threading.Lock()
+    _start_log_listener()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _data_file() -> str:
+    return os.fspath(app.config.get("SURVEY_DATA_FILE", RESULTS_PATH))
+
+
+def _submission_index(path: str) -> SubmissionIndex:
+    """Dedupe index for ``path``; opened (or built) on first use."""
+    indexes = app.extensions.setdefault("survey_index", {})
+    if path not in indexes:
+        indexes[path] = SubmissionIndex(path)
+    return indexes[path]
+
+
+def _skip_instrumentation() -> bool:
+    # CORS preflights and health probes are not timed or logged
+    return request.method == "OPTIONS" or request.path == "/ping"
+
+
+def _json_response(body: Dict[str, Any], status: int = 200) -> Response:
+    """Serialize with orjson straight into a Response, bypassing jsonify."""
+    return Response(orjson.dumps(body), status=status, mimetype="application/json")
+
+
+# /ping body is constant apart from the timestamp between these two parts
+_PING_PREFIX = b'{"message":"API is alive","status":"ok","utc_time":"'
+_PING_SUFFIX = b'"}'
 
 
 @app.before_request
 def _start_timer():
-    request._start_time = time.time()
-    request._request_id = str(uuid.uuid4())
+    if _skip_instrumentation():
+        return
+    request._start_ns = time.monotonic_ns()
+    request._request_id = f"{_PID}-{_BOOT}-{next(_REQ_COUNTER)}"
 
 
 @app.route("/ping", methods=["GET"])
 def ping():
     """Simple health check endpoint."""
-    return jsonify(
-        {
-            "status": "ok",
-            "message": "API is alive",
-            "utc_time": datetime.now(timezone.utc).isoformat(),
-        }
-    )
+    now = datetime.now(timezone.utc).isoformat().encode()
+    return Response(_PING_PREFIX + now + _PING_SUFFIX, mimetype="application/json")
+
+
+def _load_static_assets() -> Dict[str, Tuple[bytes, str, float]]:
+    """Read the frontend files once: name -> (body, etag, mtime)."""
+    assets = {}
+    frontend = Path(app.root_path) / "frontend"
+    for name in ("index.html", "styles.css"):
+        path = frontend / name
+        try:
+            body = path.read_bytes()
+            mtime = path.stat().st_mtime
+        except OSError:
+            continue
+        assets[name] = (body, blake2b(body).hexdigest()[:16], mtime)
+    return assets
+
+
+app.extensions["static_assets"] = _load_static_assets()
+
+
+def _static_asset(name: str) -> Response:
+    asset = app.extensions["static_assets"].get(name)
+    if asset is None:
+        abort(404)
+    body, etag, mtime = asset
+    response = Response(body, mimetype=mimetypes.guess_type(name)[0])
+    response.set_etag(etag)
+    response.last_modified = mtime
+    response.cache_control.max_age = 300
+    # Turns into a bodiless 304 when If-None-Match / If-Modified-Since match
+    return response.make_conditional(request)
 
 
 @app.route("/", methods=["GET"])
 def index():
     # Serve the frontend index.html from ./frontend
-    return send_from_directory("frontend", "index.html")
+    return _static_asset("index.html")
 
 
 @app.route("/styles.css", methods=["GET"])
 def styles():
-    return send_from_directory("frontend", "styles.css")
+    return _static_asset("styles.css")
 
 
 @app.post("/v1/survey")
 def submit_survey():
     payload = request.get_json(silent=True)
     if payload is None:
-        return (
-            jsonify({"error": "invalid_json", "message": "Request body must be JSON"}),
-            400,
+        return _json_response(
+            {"error": "invalid_json", "message": "Request body must be JSON"}, 400
         )
 
     try:
-        submission = SurveySubmission(**payload)
+        submission = SURVEY_VALIDATOR.validate_python(payload)
     except ValidationError as ve:
-        return jsonify({"error": "validation_error", "details": ve.errors()}), 422
+        # Inputs are not echoed back: they may be unserializable or personal data
+        details = ve.errors(
+            include_url=False, include_context=False, include_input=False
+        )
+        return _json_response({"error": "validation_error", "details": details}, 422)
 
     # Enrich with user_agent and ip
     if not getattr(submission, "user_agent", None):
@@ -65,52 +181,39 @@ def submit_survey():
             submission.user_agent = ua
 
     now = datetime.now(timezone.utc)
-    client_ip = (
-        request.headers.get("X-Forwarded-For", "").split(",")[0].strip()
-        or (request.access_route and request.access_route[0])
-        or request.remote_addr
-        or ""
-    )
+    # access_route is Werkzeug's cached parse of X-Forwarded-For
+    route = request.access_route
+    client_ip = (route[0] if route else "") or request.remote_addr or ""
     record = submission.to_storage_record(now, ip=client_ip)
 
     # Dedupe by submission_id + exact same payload fields
-    is_dup = False
-    for existing in iter_json_lines(RESULTS_PATH):
-        if (
-            existing.get("submission_id") == record.get("submission_id")
-            and existing.get("email") == record.get("email")
-            and existing.get("age") == record.get("age")
-            and existing.get("name") == record.get("name")
-            and existing.get("consent") == record.get("consent")
-            and existing.get("rating") == record.get("rating")
-            and existing.get("comments") == record.get("comments")
-            and existing.get("source") == record.get("source")
-        ):
-            is_dup = True
-            break
-
-    if not is_dup:
-        append_json_line(record)
-
-    return jsonify({"status": "ok", "submission_id": record["submission_id"]}), 201
+    data_file = _data_file()
+    with _index_lock:
+        if _submission_index(data_file).add_if_new(record):
+            append_json_line(record, data_file)
+
+    return _json_response(
+        {"status": "ok", "submission_id": record["submission_id"]}, 201
+    )
 
 
 @app.after_request
 def _log(response):
-    latency_ms = int(
-        (time.time() - getattr(request, "_start_time", time.time())) * 1000
-    )
-    logger.info(
-        {
-            "request_id": getattr(request, "_request_id", "-"),
-            "method": request.method,
-            "path": request.path,
-            "status": response.status_code,
-            "latency_ms": latency_ms,
-        }
-    )
+    if _skip_instrumentation() or not logger.isEnabledFor(logging.INFO):
+        return response
+    now_ns = time.monotonic_ns()
+    latency_ms = (now_ns - getattr(request, "_start_ns", now_ns)) // 1_000_000
+    entry = {
+        "request_id": getattr(request, "_request_id", "-"),
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "latency_ms": latency_ms,
+    }
+    logger.info("%s", orjson.dumps(entry).decode())
     return response
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    # Development server only; production runs `gunicorn wsgi:app`
+    app.run(debug=os.environ.get("FLASK_DEBUG") == "1")
@@ -0,0 +1,11 @@
+"""Gunicorn settings, picked up automatically when run from the repo root."""
+
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = 8
+# Import the app (and build the pydantic validator) once, before forking
+preload_app = True
@@ -1,46 +1,93 @@
-from datetime import datetime
-from hashlib import sha256
+import os
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+from hashlib import blake2b, sha256
 from typing import Any, Dict, Optional
-from pydantic import BaseModel, Field, EmailStr, validator
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    Field,
+    TypeAdapter,
+    field_validator,
+)
+
+# Deliberately loose: one "@", no whitespace, a dot in the domain
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+# blake2b is the default; set SURVEY_HASH_ALGORITHM=sha256 to keep producing
+# digests that match records written before the switch.
+HASH_ALGORITHM = os.environ.get("SURVEY_HASH_ALGORITHM", "blake2b")
+if HASH_ALGORITHM not in {"blake2b", "sha256"}:
+    raise ValueError(f"unsupported SURVEY_HASH_ALGORITHM: {HASH_ALGORITHM!r}")
+
+
+def _new_hash(data: bytes = b"") -> Any:
+    if HASH_ALGORITHM == "sha256":
+        return sha256(data)
+    return blake2b(data, digest_size=32)
 
 
 def hash_text(value: str) -> str:
-    return sha256(value.encode("utf-8")).hexdigest()
+    return _new_hash(value.encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=4)
+def _bucket_for_hour(epoch_hour: int) -> str:
+    # Same as strftime("%Y%m%d%H"), without the libc/locale round trip
+    ts = datetime.fromtimestamp(epoch_hour * 3600, timezone.utc)
+    return f"{ts.year:04d}{ts.month:02d}{ts.day:02d}{ts.hour:02d}"
+
+
+def _hour_bucket(timestamp: datetime) -> str:
+    """UTC hour bucket, computed once per hour rather than once per request."""
+    if timestamp.tzinfo is None:
+        # Naive means UTC wall time, as strftime read it; not local time
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return _bucket_for_hour(int(timestamp.timestamp()) // 3600)
 
 
 def compute_submission_id(email: str, timestamp: datetime) -> str:
-    bucket = timestamp.strftime("%Y%m%d%H")
-    return hash_text(email + bucket)
+    return hash_text(email + _hour_bucket(timestamp))
 
 
 class SurveySubmission(BaseModel):
     name: str = Field(..., min_length=1, max_length=100)
-    email: EmailStr
+    email: str = Field(..., max_length=254)
     age: int = Field(..., ge=13, le=120)
     consent: bool = Field(..., description="Must be true to accept")
     rating: int = Field(..., ge=1, le=5)
-    comments: Optional[str] = Field("", max_length=1000)
+    comments: Optional[str] = Field("", max_length=1000, validate_default=True)
     source: Optional[str] = Field(
-        "other", description="web|mobile|other; default other"
+        "other", description="web|mobile|other; default other", validate_default=True
     )
     user_agent: Optional[str] = Field(None)
     submission_id: Optional[str] = Field(None)
 
-    class Config:
-        anystr_strip_whitespace = True
+    model_config = ConfigDict(str_strip_whitespace=True)
 
-    @validator("comments", pre=True, always=True)
+    @field_validator("comments", mode="before")
+    @classmethod
     def _default_comments(cls, v: Optional[str]) -> str:
         return (v or "").strip()
 
-    @validator("source", pre=True, always=True)
+    @field_validator("source", mode="before")
+    @classmethod
     def _normalize_source(cls, v: Optional[str]) -> str:
         if not v:
             return "other"
         s = str(v).strip().lower()
         return s if s in {"web", "mobile", "other"} else "other"
 
-    @validator("consent")
+    @field_validator("email")
+    @classmethod
+    def _check_email(cls, v: str) -> str:
+        if not _EMAIL_RE.match(v):
+            raise ValueError("value is not a valid email address")
+        return v.lower()
+
+    @field_validator("consent")
+    @classmethod
     def _must_consent(cls, v: bool) -> bool:
         if v is not True:
             raise ValueError("consent must be true")
@@ -49,8 +96,15 @@ class SurveySubmission(BaseModel):
     def to_storage_record(
         self, timestamp: datetime, ip: Optional[str] = None
     ) -> Dict[str, Any]:
-        email_norm = str(self.email).lower()
-        sub_id = self.submission_id or compute_submission_id(email_norm, timestamp)
+        email_norm = self.email  # lowercased by _check_email
+        # One hash object yields both digests: hashing email, then feeding
+        # the hour bucket, equals compute_submission_id(email, timestamp).
+        h = _new_hash(email_norm.encode("utf-8"))
+        email_hash = h.hexdigest()
+        sub_id = self.submission_id
+        if not sub_id:
+            h.update(_hour_bucket(timestamp).encode("utf-8"))
+            sub_id = h.hexdigest()
         record: Dict[str, Any] = {
             "submission_id": sub_id,
             "name": self.name,
@@ -58,7 +112,7 @@ class SurveySubmission(BaseModel):
             "rating": self.rating,
             "comments": self.comments,
             "source": self.source or "other",
-            "email": hash_text(email_norm),
+            "email": email_hash,
             "age": hash_text(str(self.age)),
             "received_at": timestamp.isoformat(),
         }
@@ -67,3 +121,7 @@ class SurveySubmission(BaseModel):
         if ip:
             record["ip"] = ip
         return record
+
+
+# Build the pydantic-core validator once at import instead of per request
+SURVEY_VALIDATOR = TypeAdapter(SurveySubmission)
@@ -1,22 +1,264 @@
-import json
+import atexit
+import itertools
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from hashlib import blake2b
 from pathlib import Path
-from datetime import datetime
-from typing import Mapping, Any, Iterator, Dict
+from typing import (
+    BinaryIO,
+    Mapping,
+    Any,
+    Iterable,
+    Iterator,
+    Dict,
+    List,
+    Optional,
+    Union,
+)
+
+import orjson
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, and no forked workers to race with
+    fcntl = None
 
 RESULTS_PATH = Path("data/survey.ndjson")
+StrPath = Union[str, "os.PathLike[str]"]
 
+# Fields that must all match for a submission to count as a duplicate.
+FINGERPRINT_FIELDS = (
+    "submission_id",
+    "email",
+    "age",
+    "name",
+    "consent",
+    "rating",
+    "comments",
+    "source",
+)
 
-def append_json_line(record: Mapping[str, Any]) -> None:
-    RESULTS_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with RESULTS_PATH.open("a", encoding="utf-8") as f:
-        f.write(
-            json.dumps(
-                record,
-                ensure_ascii=False,
-                default=lambda o: o.isoformat() if isinstance(o, datetime) else o,
-            )
-            + "\n"
-        )
+
+logger = logging.getLogger(__name__)
+
+_FLUSH = object()
+_STOP = object()
+
+
+class AsyncAppender:
+    """Append NDJSON records from a background thread.
+
+    Records are queued by the caller and serialized by a single daemon
+    writer, which batches them into one ``write()`` per file whenever
+    ``buffer_size`` bytes have accumulated or ``flush_interval_ms`` has
+    elapsed since the first unflushed record. Each target file is opened
+    once and kept open for the life of the writer.
+    """
+
+    def __init__(
+        self,
+        flush_interval_ms: int = 50,
+        buffer_size: int = 64 * 1024,
+        max_queue: int = 10_000,
+    ) -> None:
+        self._flush_interval = flush_interval_ms / 1000
+        self._buffer_size = buffer_size
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        # Keyed by plain str paths: no Path objects on the append hot path
+        self._buffers: Dict[str, bytearray] = {}
+        self._buffered = 0
+        self._handles: Dict[str, BinaryIO] = {}
+        self._handle_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def append(self, record: Mapping[str, Any], path: StrPath) -> None:
+        self._ensure_started()
+        item = (os.fspath(path), record)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Never drop a submission: apply backpressure instead
+            self._queue.put(item)
+
+    def flush(self) -> None:
+        """Block until every record queued so far has been written.
+
+        Raises ``OSError`` if some could not be written; they stay buffered
+        and are retried on the next flush.
+        """
+        if self._thread is None:
+            return
+        self._ensure_started()
+        done = threading.Event()
+        pending: List[int] = []
+        self._queue.put((_FLUSH, (done, pending)))
+        done.wait()
+        if pending:
+            raise OSError(f"{pending[0]} bytes of NDJSON are not yet written")
+
+    def flush_and_close(self) -> None:
+        """Write out pending records and stop the writer thread."""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put((_STOP, None))
+        thread.join()
+        self.reopen()
+
+    def reopen(self) -> None:
+        """Close cached handles so the next write reopens them (e.g. after rotation)."""
+        with self._handle_lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+        for handle in handles:
+            handle.close()
+
+    def reset_after_fork(self) -> None:
+        """Drop state inherited from the parent; a forked child writes on its own."""
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        # Anything still buffered belongs to the parent and is written there
+        self._buffers = {}
+        self._buffered = 0
+        self._handles = {}
+        self._handle_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self) -> None:
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            return
+        with self._start_lock:
+            # Also replaces a writer that died, so queued records still drain
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="survey-appender", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        deadline = 0.0
+        while True:
+            timeout = None
+            if self._buffered:
+                timeout = max(0.0, deadline - time.monotonic())
+            try:
+                target, item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._write_buffers()
+                # Anything left failed to write; retry after another interval
+                deadline = time.monotonic() + self._flush_interval
+                continue
+
+            if target is _FLUSH:
+                done, pending = item
+                self._write_buffers()
+                if self._buffered:
+                    pending.append(self._buffered)
+                done.set()
+                continue
+            if target is _STOP:
+                self._write_buffers()
+                return
+
+            try:
+                line = orjson.dumps(item) + b"\n"
+            except orjson.JSONEncodeError:
+                logger.exception("dropping unserializable record for %s", target)
+                continue
+            if not self._buffered:
+                deadline = time.monotonic() + self._flush_interval
+            self._buffers.setdefault(target, bytearray()).extend(line)
+            self._buffered += len(line)
+            if self._buffered >= self._buffer_size:
+                self._write_buffers()
+
+    def _handle_for(self, path: str) -> BinaryIO:
+        handle = self._handles.get(path)
+        if handle is None:
+            # Directory is only ensured when a handle is (re)opened
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            # Unbuffered, so a failed write leaves nothing half-flushed behind
+            handle = self._handles[path] = open(path, "ab", buffering=0)
+        return handle
+
+    def _write_buffers(self) -> None:
+        """Write every buffer; ones that fail stay buffered for the next flush."""
+        for path in list(self._buffers):
+            buf = self._buffers[path]
+            written = 0
+            try:
+                with self._handle_lock:
+                    handle = self._handle_for(path)
+                    with memoryview(buf) as view:
+                        while written < len(buf):
+                            written += handle.write(view[written:])
+            except Exception:
+                # Not only OSError: the writer thread must never die here
+                logger.exception("failed to write %d bytes to %s", len(buf), path)
+                self._drop_handle(path)
+            # Keep only what did not reach the file, so a retry never duplicates
+            del buf[:written]
+            self._buffered -= written
+            if not buf:
+                del self._buffers[path]
+
+    def _drop_handle(self, path: str) -> None:
+        # Reopen on retry, in case the failure was tied to this descriptor
+        with self._handle_lock:
+            handle = self._handles.pop(path, None)
+        if handle is not None:
+            try:
+                handle.close()
+            except OSError:
+                pass
+
+
+APPENDER = AsyncAppender()
+atexit.register(APPENDER.flush_and_close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=APPENDER.reset_after_fork)
+
+
+def append_json_line(record: Mapping[str, Any], path: StrPath = RESULTS_PATH) -> None:
+    """Queue ``record`` for its shard of ``path``; returns without blocking on I/O."""
+    APPENDER.append(record, shard_path(path, record["submission_id"]))
+
+
+_HEX_DIGITS = frozenset("0123456789abcdef")
+
+
+def _shard_for(submission_id: str) -> str:
+    prefix = submission_id[:2].lower()
+    if len(prefix) == 2 and _HEX_DIGITS.issuperset(prefix):
+        return prefix
+    # Client-supplied ids can be anything; never put them in a file name
+    return blake2b(submission_id.encode("utf-8"), digest_size=1).hexdigest()
+
+
+def shard_path(path: StrPath, submission_id: str) -> str:
+    """File holding ``submission_id``: ``survey.ndjson`` -> ``survey.<xx>.ndjson``.
+
+    Records are spread over 256 shards by the first two hex digits of the
+    id, so a dedupe scan only has to read one of them.
+    """
+    root, ext = os.path.splitext(os.fspath(path))
+    return f"{root}.{_shard_for(submission_id)}{ext}"
+
+
+def iter_survey_records(path: StrPath = RESULTS_PATH) -> Iterator[Dict[str, Any]]:
+    """Every record stored under ``path``: the legacy unsharded file, then shards."""
+    base = Path(path)
+    shards = sorted(base.parent.glob(f"{base.stem}.[0-9a-f][0-9a-f]{base.suffix}"))
+    return itertools.chain.from_iterable(iter_json_lines(p) for p in [base, *shards])
 
 
 def iter_json_lines(path: Path = RESULTS_PATH) -> Iterator[Dict[str, Any]]:
@@ -24,11 +266,154 @@ def iter_json_lines(path: Path = RESULTS_PATH) -> Iterator[Dict[str, Any]]:
         return iter(())
 
     def _gen() -> Iterator[Dict[str, Any]]:
-        with path.open("r", encoding="utf-8") as f:
+        with path.open("rb") as f:
             for line in f:
-                line = line.strip()
-                if not line:
+                if line.isspace():
                     continue
-                yield json.loads(line)
+                yield orjson.loads(line)
 
     return _gen()
+
+
+def record_fingerprint(record: Mapping[str, Any]) -> str:
+    """Digest of the dedupe fields; equal fingerprints mean a duplicate."""
+    values = [record.get(field) for field in FINGERPRINT_FIELDS]
+    return blake2b(orjson.dumps(values), digest_size=16).hexdigest()
+
+
+class BloomIndex:
+    """Bloom filter over string keys, persisted in a memory-mapped file.
+
+    A miss means the key was never added; a hit may be a false positive.
+    The file is built from ``seed`` when missing or created with other
+    parameters, and is renamed into place only once fully populated.
+    Building, opening and setting bits hold an exclusive ``flock`` on a
+    ``<name>.lock`` sidecar, so processes sharing the file neither build
+    it twice nor lose each other's bits.
+    """
+
+    MAGIC = b"SVBLOOM1"
+    HEADER = struct.Struct("<8sQI")
+
+    def __init__(
+        self,
+        path: Path,
+        seed: Iterable[str] = (),
+        num_bits: int = 1 << 23,
+        num_hashes: int = 7,
+    ) -> None:
+        self.path = path
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self._size = self.HEADER.size + (num_bits + 7) // 8
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock_file = open(path.with_name(f"{path.name}.lock"), "a+b")
+        self._thread_lock = threading.Lock()
+        with self.locked():
+            # Checked under the lock: another process may have just built it
+            if not self._has_valid_header():
+                self._build(seed)
+            self._file = open(path, "r+b")
+            self._mm = mmap.mmap(self._file.fileno(), self._size)
+
+    def __contains__(self, key: str) -> bool:
+        mm, offset = self._mm, self.HEADER.size
+        return all(
+            mm[offset + (bit >> 3)] & (1 << (bit & 7)) for bit in self._bits(key)
+        )
+
+    def add(self, key: str) -> None:
+        with self.locked():
+            self._set_bits(self._mm, key)
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+        self._lock_file.close()
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Exclusive across threads and processes sharing this filter."""
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _bits(self, key: str) -> Iterator[int]:
+        # Double hashing: k positions from one 128-bit digest
+        digest = blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def _set_bits(self, mm: mmap.mmap, key: str) -> None:
+        offset = self.HEADER.size
+        for bit in self._bits(key):
+            mm[offset + (bit >> 3)] |= 1 << (bit & 7)
+
+    def _has_valid_header(self) -> bool:
+        try:
+            if self.path.stat().st_size != self._size:
+                return False
+            with self.path.open("rb") as f:
+                header = f.read(self.HEADER.size)
+        except OSError:
+            return False
+        return header == self.HEADER.pack(self.MAGIC, self.num_bits, self.num_hashes)
+
+    def _build(self, seed: Iterable[str]) -> None:
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w+b") as f:
+            f.truncate(self._size)
+            f.write(self.HEADER.pack(self.MAGIC, self.num_bits, self.num_hashes))
+            f.flush()
+            with mmap.mmap(f.fileno(), self._size) as mm:
+                for key in seed:
+                    self._set_bits(mm, key)
+                mm.flush()
+        os.replace(tmp_path, self.path)
+
+
+class SubmissionIndex:
+    """Dedupe index for one (sharded) NDJSON store.
+
+    Fingerprints are probed against a ``BloomIndex`` stored next to the
+    data file (``survey.ndjson`` -> ``survey.bloom``). Only a Bloom hit
+    falls back to scanning the record's shard to rule out a false positive.
+    A legacy unsharded ``survey.ndjson`` is never written to, so its
+    fingerprints are read once into memory and never rescanned.
+    """
+
+    def __init__(self, path: StrPath = RESULTS_PATH) -> None:
+        self.path = Path(path)
+        seed = (record_fingerprint(r) for r in iter_survey_records(self.path))
+        self._bloom = BloomIndex(self.path.with_suffix(".bloom"), seed=seed)
+        self._legacy = frozenset(
+            record_fingerprint(r) for r in iter_json_lines(self.path)
+        )
+
+    def add_if_new(self, record: Mapping[str, Any]) -> bool:
+        """Remember ``record``; False if an identical one is already stored."""
+        fingerprint = record_fingerprint(record)
+        if fingerprint in self._bloom and self._is_stored(record, fingerprint):
+            return False
+        self._bloom.add(fingerprint)
+        return True
+
+    def close(self) -> None:
+        self._bloom.close()
+
+    def _is_stored(self, record: Mapping[str, Any], fingerprint: str) -> bool:
+        if fingerprint in self._legacy:
+            return True
+        # Records may still be queued for the writer; get them on disk first.
+        # If that fails, raise rather than miss a duplicate still in memory.
+        APPENDER.flush()
+        shard = Path(shard_path(self.path, record["submission_id"]))
+        return any(record_fingerprint(r) == fingerprint for r in iter_json_lines(shard))
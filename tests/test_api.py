@@ -1,13 +1,38 @@
 from __future__ import annotations
 
+import hashlib
 import json
-from datetime import datetime
+import logging
+import multiprocessing
+import time
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Dict, Iterator
 
 import pytest
 
+import app as app_module
+import models
 from app import app
+from models import SURVEY_VALIDATOR, compute_submission_id, hash_text
+import storage
+from storage import (
+    APPENDER,
+    AsyncAppender,
+    BloomIndex,
+    SubmissionIndex,
+    iter_json_lines,
+    shard_path,
+)
+
+GOOD = {
+    "name": "Ava",
+    "email": "ava@example.com",
+    "age": 22,
+    "consent": True,
+    "rating": 4,
+    "source": "web",
+}
 
 
 @pytest.fixture()
@@ -18,10 +43,42 @@ def client(tmp_path: Path):
         yield c
 
 
+@pytest.fixture()
+def request_logs():
+    """Messages sent to the request logger during the test."""
+    messages = []
+
+    class _Collect(logging.Handler):
+        def emit(self, record: logging.LogRecord) -> None:
+            messages.append(record.getMessage())
+
+    handler = _Collect()
+    logger = app_module.logger
+    level = logger.level
+    # Under pytest, basicConfig is a no-op, so INFO may not be enabled
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    yield messages
+    logger.removeHandler(handler)
+    logger.setLevel(level)
+
+
 def load_records(file_path: Path) -> Iterator[Dict]:
-    with file_path.open("r", encoding="utf-8") as handle:
-        for line in handle:
-            yield json.loads(line)
+    # Records are sharded: survey.ndjson -> survey.<xx>.ndjson
+    for shard in sorted(file_path.parent.glob(f"{file_path.stem}.*.ndjson")):
+        with shard.open("r", encoding="utf-8") as handle:
+            for line in handle:
+                yield json.loads(line)
+
+
+def test_ping(client):
+    r = client.get("/ping")
+    assert r.status_code == 200
+    assert r.mimetype == "application/json"
+    body = r.get_json()
+    assert list(json.loads(r.data)) == ["message", "status", "utc_time"]
+    assert body["status"] == "ok"
+    assert datetime.fromisoformat(body["utc_time"]).tzinfo is not None
 
 
 def test_requires_json(client):
@@ -36,6 +93,19 @@ def test_validation_error(client):
     assert r.get_json()["error"] == "validation_error"
 
 
+def test_validation_error_for_out_of_range_int(client):
+    r = client.post(
+        "/v1/survey",
+        data='{"name": "Ava", "email": "ava@example.com", "age": 22, '
+        '"consent": true, "rating": 1000000000000000000000000000000}',
+        content_type="application/json",
+    )
+    assert r.status_code == 422
+    (detail,) = r.get_json()["details"]
+    assert detail["loc"] == ["rating"]
+    assert "input" not in detail
+
+
 def test_happy_path(client):
     good = {
         "name": "Ava",
@@ -50,3 +120,199 @@ def test_happy_path(client):
     body = r.get_json()
     assert body["status"] == "ok"
     assert len(body["submission_id"]) == 64
+
+
+def test_duplicate_submission_is_stored_once(client, tmp_path: Path):
+    first = client.post("/v1/survey", json=GOOD)
+    second = client.post("/v1/survey", json=GOOD)
+    assert first.get_json()["submission_id"] == second.get_json()["submission_id"]
+
+    changed = client.post("/v1/survey", json={**GOOD, "rating": 5})
+    assert changed.status_code == 201
+
+    APPENDER.flush()
+    records = list(load_records(tmp_path / "survey.ndjson"))
+    assert [r["rating"] for r in records] == [4, 5]
+
+
+def test_dedupe_index_is_rebuilt_from_disk(client, tmp_path: Path):
+    client.post("/v1/survey", json=GOOD)
+    APPENDER.flush()
+    # Simulate a restart: drop the cached index and its on-disk filter
+    for index in app.extensions.pop("survey_index").values():
+        index.close()
+    (tmp_path / "survey.bloom").unlink()
+
+    client.post("/v1/survey", json=GOOD)
+    APPENDER.flush()
+    assert len(list(load_records(tmp_path / "survey.ndjson"))) == 1
+
+
+def test_index_supports_conditional_get(client):
+    r = client.get("/")
+    assert r.status_code == 200
+    assert r.mimetype == "text/html"
+    etag = r.headers["ETag"]
+
+    cached = client.get("/", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.data == b""
+
+
+def test_client_ip_from_forwarded_for(client, tmp_path: Path):
+    headers = {"X-Forwarded-For": "203.0.113.7, 10.0.0.1"}
+    client.post("/v1/survey", json=GOOD, headers=headers)
+    APPENDER.flush()
+    (record,) = load_records(tmp_path / "survey.ndjson")
+    assert record["ip"] == "203.0.113.7"
+
+
+def test_records_are_sharded_by_submission_id(client, tmp_path: Path):
+    sid = client.post("/v1/survey", json=GOOD).get_json()["submission_id"]
+    APPENDER.flush()
+    shard = tmp_path / f"survey.{sid[:2]}.ndjson"
+    lines = shard.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["submission_id"] for line in lines] == [sid]
+    assert not (tmp_path / "survey.ndjson").exists()
+
+
+def test_appender_retries_failed_writes(tmp_path: Path):
+    appender = AsyncAppender(flush_interval_ms=1)
+    blocker = tmp_path / "data"
+    blocker.write_text("not a directory")  # makes the first write fail
+    target = blocker / "survey.ndjson"
+
+    appender.append({"n": 1}, target)
+    with pytest.raises(OSError):
+        appender.flush()
+    assert blocker.is_file()
+
+    blocker.unlink()
+    blocker.mkdir()
+    appender.append({"n": 2}, target)
+    appender.flush()
+    appender.flush_and_close()
+    assert [r["n"] for r in iter_json_lines(target)] == [1, 2]
+
+
+def test_appender_restarts_dead_writer(tmp_path: Path):
+    appender = AsyncAppender()
+    target = tmp_path / "survey.ndjson"
+    appender.append({"n": 1}, target)
+    appender.flush()
+    # End the writer thread behind the appender's back
+    appender._queue.put((storage._STOP, None))
+    appender._thread.join(timeout=1)
+    assert not appender._thread.is_alive()
+
+    appender.append({"n": 2}, target)
+    appender.flush_and_close()
+    assert [r["n"] for r in iter_json_lines(target)] == [1, 2]
+
+
+def test_storage_record_hashes_match_helpers():
+    submission = SURVEY_VALIDATOR.validate_python({**GOOD, "email": "Ava@Example.com"})
+    ts = datetime(2025, 9, 25, 18, 11, tzinfo=timezone.utc)
+    record = submission.to_storage_record(ts)
+    assert record["submission_id"] == compute_submission_id("ava@example.com", ts)
+    assert record["email"] == hash_text("ava@example.com")
+    assert record["age"] == hash_text("22")
+
+
+def test_sha256_compat_mode(monkeypatch):
+    monkeypatch.setattr(models, "HASH_ALGORITHM", "sha256")
+    # Digest of "22" as stored by the SHA-256 version (data/survey.ndjson)
+    assert hash_text("22") == (
+        "785f3ec7eb32f30b90cd0fcf3657d388b5ff4297f2f9716ff66e9b69c05ddd09"
+    )
+    submission = SURVEY_VALIDATOR.validate_python(GOOD)
+    ts = datetime(2025, 9, 25, 18, 11, tzinfo=timezone.utc)
+    record = submission.to_storage_record(ts)
+    assert (
+        record["submission_id"]
+        == hashlib.sha256(b"ava@example.com2025092518").hexdigest()
+    )
+    assert record["email"] == hashlib.sha256(b"ava@example.com").hexdigest()
+
+
+def _open_bloom_and_add(path: Path, key: str) -> None:
+    BloomIndex(path, seed=(f"seed-{i}" for i in range(20_000))).add(key)
+
+
+@pytest.mark.skipif(storage.fcntl is None, reason="needs flock")
+def test_bloom_shared_across_processes(tmp_path: Path):
+    path = tmp_path / "survey.bloom"
+    ctx = multiprocessing.get_context("fork")
+    workers = [
+        ctx.Process(target=_open_bloom_and_add, args=(path, f"worker-{n}"))
+        for n in range(4)
+    ]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+        assert w.exitcode == 0
+
+    bloom = BloomIndex(path)
+    assert all(f"worker-{n}" in bloom for n in range(4))
+    assert "seed-0" in bloom
+
+
+def test_preflight_and_ping_are_not_logged(client, request_logs):
+    client.options(
+        "/v1/survey",
+        headers={"Origin": "http://x", "Access-Control-Request-Method": "POST"},
+    )
+    client.get("/ping")
+    assert request_logs == []
+
+    client.get("/")
+    (line,) = request_logs
+    assert json.loads(line)["path"] == "/"
+
+
+def test_legacy_file_is_read_but_left_in_place(tmp_path: Path):
+    legacy = tmp_path / "survey.ndjson"
+    old = {**GOOD, "submission_id": "ab" * 32, "received_at": "2025-09-25T18:11:34"}
+    # Pre-sharding format, as written by the stdlib json version
+    content = (json.dumps(old) + "\n").encode("utf-8")
+    legacy.write_bytes(content)
+
+    index = SubmissionIndex(legacy)
+    assert index.add_if_new(old) is False
+    assert index.add_if_new({**old, "rating": 5}) is True
+    index.close()
+
+    assert legacy.read_bytes() == content
+    assert list(load_records(legacy)) == []
+
+
+def test_dedupe_refuses_to_guess_while_writes_fail(tmp_path: Path, monkeypatch):
+    index = SubmissionIndex(tmp_path / "survey.ndjson")
+    record = {**GOOD, "submission_id": "ab" * 32}
+    assert index.add_if_new(record)
+    APPENDER.append(record, shard_path(tmp_path / "survey.ndjson", "ab"))
+
+    def _fail(path: str):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(APPENDER, "_handle_for", _fail)
+    with pytest.raises(OSError):
+        index.add_if_new(record)
+    monkeypatch.undo()
+
+    assert index.add_if_new(record) is False
+    index.close()
+
+
+@pytest.mark.skipif(not hasattr(time, "tzset"), reason="needs time.tzset")
+def test_submission_id_ignores_local_timezone_for_naive_datetimes(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        naive = datetime(2025, 9, 25, 18, 11)
+        expected = hash_text("ava@example.com" + naive.strftime("%Y%m%d%H"))
+        assert compute_submission_id("ava@example.com", naive) == expected
+    finally:
+        monkeypatch.undo()
+        time.tzset()
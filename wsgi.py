@@ -0,0 +1,3 @@
+"""WSGI entry point: ``gunicorn wsgi:app`` (settings in gunicorn.conf.py)."""
+
+from app import app  # noqa: F401